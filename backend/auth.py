@@ -2,15 +2,22 @@
 Authentication utilities for JWT tokens and password hashing.
 """
 import os
+import time
+import asyncio
+import hmac
+import base64
 import hashlib
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 
+from cachetools import TLRUCache, TTLCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlalchemy import select
+import bcrypt
+import jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
@@ -20,18 +27,57 @@ from models import User
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production-please")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 7
+DECODE_OPTIONS = {"require": ["exp", "sub"], "verify_signature": True}
+BCRYPT_ROUNDS = 12
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# HS256 key material prepared once at import; PyJWT uses a PyJWK's key as-is
+# when verifying instead of re-preparing the secret on every decode
+_SECRET_KEY_BYTES = SECRET_KEY.encode()
+_SIGNING_KEY = jwt.PyJWK(
+    {"kty": "oct", "k": base64.urlsafe_b64encode(_SECRET_KEY_BYTES).rstrip(b"=").decode('ascii')},
+    algorithm=ALGORITHM,
+)
+
+# Password pre-hash schemes, recorded per user in User.hash_scheme
+LEGACY_HASH_SCHEME = "legacy"
+SHA256_HASH_SCHEME = "sha256_b64"
+HASH_SCHEME = "blake2b_b64"
+
+# bcrypt variant written for new hashes; others are flagged for rehash
+BCRYPT_IDENT = "2b"
+
+# bcrypt is CPU-bound; a pool sized to the cores queues work instead of
+# oversubscribing the CPU from the default 40-thread executor
+_bcrypt_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="bcrypt")
 
 # Bearer token security
 security = HTTPBearer()
 
+# Cache of successfully decoded tokens, keyed by a digest of the raw token.
+# Entries live at most TOKEN_CACHE_TTL seconds and never past the token's exp.
+TOKEN_CACHE_TTL = 60
 
-def _pre_hash_password(password: str) -> str:
+
+def _token_ttu(_key, payload: dict, now: float) -> float:
+    return min(now + TOKEN_CACHE_TTL, payload["exp"])
+
+
+_token_cache = TLRUCache(maxsize=4096, ttu=_token_ttu, timer=time.time)
+_token_cache_lock = threading.Lock()
+
+# Detached User rows for recently authenticated users, keyed by user id
+_user_cache: TTLCache = TTLCache(maxsize=2048, ttl=30)
+_user_cache_lock = threading.Lock()
+
+# Recent successful password checks, keyed by an HMAC of (password, hash)
+_verify_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+_verify_cache_lock = threading.Lock()
+
+
+def _legacy_pre_hash_password(password: str) -> str:
     """
-    Pre-hash password with SHA-256 to handle passwords longer than 72 bytes.
-    bcrypt has a 72-byte limit, so we hash long passwords first.
+    Pre-hash used by the "legacy" scheme: only passwords longer than
+    bcrypt's 72-byte limit are replaced by their SHA-256 hex digest.
     """
     if len(password.encode('utf-8')) > 72:
         # Hash with SHA-256 and return hex digest
@@ -39,16 +85,97 @@ def _pre_hash_password(password: str) -> str:
     return password
 
 
+def _sha256_pre_hash_password(password: str) -> str:
+    """Pre-hash used by the "sha256_b64" scheme: base64 of the SHA-256 digest."""
+    return base64.b64encode(hashlib.sha256(password.encode('utf-8')).digest()).decode('ascii')
+
+
+def _pre_hash_password(password: str) -> str:
+    """
+    Pre-hash every password with BLAKE2b (32-byte digest) and base64-encode it.
+    The result is always 44 ASCII characters, well under bcrypt's 72-byte limit.
+    """
+    digest = hashlib.blake2b(password.encode('utf-8'), digest_size=32).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+_PRE_HASHERS = {
+    LEGACY_HASH_SCHEME: _legacy_pre_hash_password,
+    SHA256_HASH_SCHEME: _sha256_pre_hash_password,
+    HASH_SCHEME: _pre_hash_password,
+}
+
+
 def hash_password(password: str) -> str:
-    """Hash a password using bcrypt with pre-hashing for long passwords."""
+    """Hash a password using bcrypt under the current HASH_SCHEME."""
     pre_hashed = _pre_hash_password(password)
-    return pwd_context.hash(pre_hashed)
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS, prefix=BCRYPT_IDENT.encode('ascii'))
+    return bcrypt.hashpw(pre_hashed.encode('utf-8'), salt).decode('ascii')
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash."""
-    pre_hashed = _pre_hash_password(plain_password)
-    return pwd_context.verify(pre_hashed, hashed_password)
+def _bcrypt_verify(pre_hashed: str, hashed_password: str) -> bool:
+    try:
+        return bcrypt.checkpw(pre_hashed.encode('utf-8'), hashed_password.encode('ascii'))
+    except ValueError:
+        # Malformed or non-bcrypt hash
+        return False
+
+
+def _verify_cache_key(plain_password: str, hashed_password: str, scheme: str) -> bytes:
+    message = b"\0".join(
+        part.encode('utf-8') for part in (scheme, plain_password, hashed_password)
+    )
+    return hmac.new(_SECRET_KEY_BYTES, message, hashlib.sha256).digest()
+
+
+def verify_password(plain_password: str, hashed_password: str, scheme: str = HASH_SCHEME) -> bool:
+    """Verify a password against its hash, skipping bcrypt for recent matches."""
+    key = _verify_cache_key(plain_password, hashed_password, scheme)
+    with _verify_cache_lock:
+        if key in _verify_cache:
+            return True
+    
+    pre_hashed = _PRE_HASHERS[scheme](plain_password)
+    verified = _bcrypt_verify(pre_hashed, hashed_password)
+    with _verify_cache_lock:
+        if verified:
+            _verify_cache[key] = True
+        else:
+            _verify_cache.pop(key, None)
+    return verified
+
+
+# Hash of a random password, verified against when a login email is unknown
+# so the response takes as long as a real password check
+DUMMY_PASSWORD_HASH = hash_password(secrets.token_urlsafe(32))
+
+
+async def ahash_password(password: str) -> str:
+    """hash_password on the dedicated bcrypt pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_pool, hash_password, password)
+
+
+async def averify_password(plain_password: str, hashed_password: str, scheme: str = HASH_SCHEME) -> bool:
+    """verify_password on the dedicated bcrypt pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _bcrypt_pool, verify_password, plain_password, hashed_password, scheme
+    )
+
+
+def password_needs_rehash(hashed_password: str, scheme: str) -> bool:
+    """Check whether a stored hash predates the current scheme or bcrypt policy."""
+    if scheme != HASH_SCHEME:
+        return True
+    # Modular crypt format: $<ident>$<rounds>$<salt+digest>
+    parts = hashed_password.split('$')
+    if len(parts) != 4 or parts[1] != BCRYPT_IDENT:
+        return True
+    try:
+        return int(parts[2]) < BCRYPT_ROUNDS
+    except ValueError:
+        return True
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -59,18 +186,28 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, _SIGNING_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
 def decode_token(token: str) -> Optional[dict]:
-    """Decode and verify a JWT token."""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    """Decode and verify a JWT token, reusing recent successful decodes."""
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    with _token_cache_lock:
+        payload = _token_cache.get(key)
+    if payload is not None:
         return payload
-    except JWTError:
+
+    try:
+        payload = jwt.decode(token, _SIGNING_KEY, algorithms=[ALGORITHM], options=DECODE_OPTIONS)
+    except jwt.PyJWTError:
         return None
 
+    # exp is required by DECODE_OPTIONS, so cached entries never outlive the token
+    with _token_cache_lock:
+        _token_cache[key] = payload
+    return payload
+
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -100,13 +237,22 @@ async def get_current_user(
     if isinstance(user_id, str):
         user_id = int(user_id)
     
-    # Get user from database
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+    with _user_cache_lock:
+        user = _user_cache.get(user_id)
+    if user is not None:
+        return user
+    
+    # Get user from database (primary key lookup via the identity map)
+    user = await db.get(User, user_id)
     
     if user is None:
         raise credentials_exception
     
+    # Detach so the cached instance isn't bound to this request's session
+    db.expunge(user)
+    with _user_cache_lock:
+        _user_cache[user_id] = user
+    
     return user
 
 
@@ -2,6 +2,8 @@
 Database configuration using SQLAlchemy async with SQLite.
 """
 import os
+from sqlalchemy import event, inspect, text
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from dotenv import load_dotenv
@@ -12,12 +14,32 @@ load_dotenv()
 # Database URL - SQLite for development
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./crime_investigation.db")
 
-# Create async engine
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# Create async engine (SQLite uses its own pool; size it only for server databases)
 engine = create_async_engine(
     DATABASE_URL,
     echo=False,  # Set to True for SQL debugging
+    **({} if IS_SQLITE else {"pool_pre_ping": True, "pool_size": 5}),
 )
 
+
+if IS_SQLITE:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """
+        WAL lets readers run alongside the writer, and with synchronous=NORMAL
+        commits no longer fsync every time while staying crash-safe.
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.execute("PRAGMA cache_size=-64000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
+
 # Create async session factory
 async_session_maker = async_sessionmaker(
     engine,
@@ -30,10 +52,37 @@ class Base(DeclarativeBase):
     pass
 
 
+def _add_missing_columns(sync_conn) -> None:
+    """
+    Add columns introduced after a table was first created.
+    create_all() skips existing tables, so new columns need an ALTER TABLE.
+    """
+    inspector = inspect(sync_conn)
+    preparer = sync_conn.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_ddl = CreateColumn(column).compile(dialect=sync_conn.dialect)
+                sync_conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {column_ddl}"))
+
+
+def _add_missing_indexes(sync_conn) -> None:
+    """Create indexes introduced after a table was first created."""
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(sync_conn)
+
+
 async def init_db():
     """Initialize database tables."""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_add_missing_indexes)
 
 
 async def get_db():
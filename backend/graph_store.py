@@ -0,0 +1,199 @@
+"""
+Persistence for per-case knowledge graphs.
+
+Graphs are stored as rows in the entities and relations tables so a chat turn
+only writes what it changed. Cases created before those tables existed keep
+their graph in cases.graph_json; it is read as a fallback and migrated into
+rows on the next save.
+
+Loaded graphs are cached in-process per case. Handlers that mutate a graph
+do so in place while holding the case's lock (see locked_case_graph).
+"""
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict
+
+import orjson
+from sqlalchemy import select, delete, func, tuple_, bindparam, lambda_stmt
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Case, Entity, Relation
+from modules.graph_manager import CrimeGraph
+
+# Stored in place of a missing relation type so the unique constraint holds
+DEFAULT_RELATION = "related_to"
+
+# Loaded graphs by case id, least recently used first
+GRAPH_CACHE_SIZE = 256
+_graph_cache: "OrderedDict[int, CrimeGraph]" = OrderedDict()
+_graph_locks: Dict[int, asyncio.Lock] = {}
+
+# Statements used on every cache miss, built once and executed with a bound case id
+_entities_for_case = lambda_stmt(
+    lambda: select(Entity.name, Entity.type, Entity.attrs_json)
+    .where(Entity.case_id == bindparam("cid"))
+    .order_by(Entity.id)
+)
+_relations_for_case = lambda_stmt(
+    lambda: select(Relation.source, Relation.target, Relation.relation_type)
+    .where(Relation.case_id == bindparam("cid"))
+    .order_by(Relation.id)
+)
+
+
+def case_graph_lock(case_id: int) -> asyncio.Lock:
+    """Lock serializing graph mutations for one case within this process."""
+    lock = _graph_locks.get(case_id)
+    if lock is None:
+        lock = _graph_locks[case_id] = asyncio.Lock()
+    return lock
+
+
+def _drop_lock(case_id: int) -> None:
+    lock = _graph_locks.get(case_id)
+    if lock is not None and not lock.locked():
+        del _graph_locks[case_id]
+
+
+def _cache_graph(case_id: int, graph: CrimeGraph) -> CrimeGraph:
+    # A concurrent load may have cached this case first; keep that instance
+    graph = _graph_cache.setdefault(case_id, graph)
+    _graph_cache.move_to_end(case_id)
+    while len(_graph_cache) > GRAPH_CACHE_SIZE:
+        evicted_id, _ = _graph_cache.popitem(last=False)
+        _drop_lock(evicted_id)
+    return graph
+
+
+def invalidate_case_graph(case_id: int) -> None:
+    """Forget a case's cached graph, e.g. after a failed write or deletion."""
+    _graph_cache.pop(case_id, None)
+    _drop_lock(case_id)
+
+
+def load_graph_from_case(case: Case) -> CrimeGraph:
+    """Load a CrimeGraph from case's stored JSON."""
+    graph = CrimeGraph()
+    if case.graph_json:
+        try:
+            data = orjson.loads(case.graph_json)
+            graph.from_json(data)
+        except (orjson.JSONDecodeError, Exception) as e:
+            print(f"Error loading graph: {e}")
+    return graph
+
+
+async def load_case_graph(db: AsyncSession, case: Case) -> CrimeGraph:
+    """Return a case's cached graph, loading it from its entity and relation rows on a miss."""
+    graph = _graph_cache.get(case.id)
+    if graph is not None:
+        _graph_cache.move_to_end(case.id)
+        return graph
+
+    result = await db.execute(_entities_for_case, {"cid": case.id})
+    entity_rows = result.all()
+
+    if not entity_rows:
+        # Not migrated yet: read graph_json and write it all out on next save
+        graph = load_graph_from_case(case)
+        graph.mark_all_changed()
+        return _cache_graph(case.id, graph)
+
+    result = await db.execute(_relations_for_case, {"cid": case.id})
+    relation_rows = result.all()
+
+    graph = CrimeGraph()
+    graph.from_records(
+        (
+            (name, dict(orjson.loads(attrs_json) if attrs_json else {}, type=entity_type))
+            for name, entity_type, attrs_json in entity_rows
+        ),
+        relation_rows,
+    )
+    return _cache_graph(case.id, graph)
+
+
+@asynccontextmanager
+async def locked_case_graph(db: AsyncSession, case: Case):
+    """
+    Hold the case's lock and yield its graph for in-place updates.
+    If the block raises, the cached graph is dropped so the next load
+    rereads what was actually committed.
+    """
+    async with case_graph_lock(case.id):
+        graph = await load_case_graph(db, case)
+        try:
+            yield graph
+        except BaseException:
+            invalidate_case_graph(case.id)
+            raise
+
+
+async def save_case_graph(db: AsyncSession, case: Case, graph: CrimeGraph) -> None:
+    """
+    Stage the entities and relations changed since the graph was loaded.
+    Only the delta is written; the caller commits.
+    """
+    nodes, edges = graph.pop_changes()
+    if not nodes and not edges:
+        return
+
+    if nodes:
+        result = await db.execute(
+            select(Entity).where(Entity.case_id == case.id, Entity.name.in_(list(nodes)))
+        )
+        existing_entities = {entity.name: entity for entity in result.scalars()}
+
+        for name, attributes in nodes.items():
+            entity_type = attributes.pop('type', None)
+            attrs_json = orjson.dumps(attributes).decode()
+            entity = existing_entities.get(name)
+            if entity:
+                entity.type = entity_type
+                entity.attrs_json = attrs_json
+            else:
+                db.add(Entity(case_id=case.id, name=name, type=entity_type, attrs_json=attrs_json))
+
+    if edges:
+        # The graph is undirected with one relation per pair, so keep only each
+        # pair's latest write and replace whatever row the pair had before
+        latest = {}
+        for source, target, relation in edges:
+            pair = frozenset((source, target))
+            latest.pop(pair, None)
+            latest[pair] = (source, target, relation or DEFAULT_RELATION)
+        endpoints = [(source, target) for source, target, _ in latest.values()]
+        endpoints += [(target, source) for source, target in endpoints]
+        result = await db.execute(
+            select(Relation).where(
+                Relation.case_id == case.id,
+                tuple_(Relation.source, Relation.target).in_(endpoints),
+            )
+        )
+        kept = set()
+        for row in result.scalars():
+            key = (row.source, row.target, row.relation_type)
+            if latest.get(frozenset((row.source, row.target))) == key:
+                kept.add(key)
+            else:
+                await db.delete(row)
+        db.add_all([
+            Relation(case_id=case.id, source=source, target=target, relation_type=relation)
+            for source, target, relation in latest.values()
+            if (source, target, relation) not in kept
+        ])
+
+    # The rows now hold the graph, so the legacy JSON copy is no longer needed
+    if case.graph_json:
+        case.graph_json = None
+
+
+async def clear_case_graph(db: AsyncSession, case: Case) -> None:
+    """Delete every entity and relation of a case; the caller commits."""
+    await db.execute(delete(Relation).where(Relation.case_id == case.id))
+    await db.execute(delete(Entity).where(Entity.case_id == case.id))
+    case.graph_json = None
+    case.updated_at = func.now()
+    _graph_cache.pop(case.id, None)
+    _cache_graph(case.id, CrimeGraph())
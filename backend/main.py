@@ -2,47 +2,88 @@
 Crime Investigation GPT API - Multi-user version with authentication and per-case graphs.
 """
 import os
-import json
-from typing import List, Dict, Any, Optional
-from io import BytesIO
+import queue
+import logging
+import logging.handlers
+from typing import List, Dict, Set, Any, Optional
 from contextlib import asynccontextmanager
 
+import anyio.to_thread
+import orjson
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, UploadFile, File, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
-import PyPDF2
+from pypdf import PdfReader
 from docx import Document
-from sqlalchemy import select
+from sqlalchemy import func
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import init_db, get_db
+from database import init_db, get_db, async_session_maker
 from models import User, Case, Message
 from auth import get_current_user, decode_token
-from modules.graph_manager import CrimeGraph
+from graph_store import load_case_graph, locked_case_graph, save_case_graph, clear_case_graph
 from modules.llm_engine import CrimeAnalyst
 from routers import auth as auth_router
 from routers import cases as cases_router
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Packages whose loggers log at INFO (this module plus routers/ and modules/)
+_APP_LOGGERS = (__name__, "routers", "modules")
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records unformatted; the listener thread formats them, tracebacks included."""
+
+    def prepare(self, record):
+        return record
+
+
+def _start_log_listener() -> logging.handlers.QueueListener:
+    """
+    Route the root logger through a queue so formatting and stderr writes
+    happen on the listener thread instead of in request handlers.
+    """
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    
+    logging.getLogger().addHandler(_DeferredQueueHandler(log_queue))
+    # INFO for this app's loggers only; libraries keep the root level
+    for name in _APP_LOGGERS:
+        app_logger = logging.getLogger(name)
+        if app_logger.level == logging.NOTSET:
+            app_logger.setLevel(logging.INFO)
+    listener.start()
+    return listener
+
 
 # Lifespan context manager for startup/shutdown
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Initialize database
+    # Startup: Start log listener and initialize database
+    log_listener = _start_log_listener()
     await init_db()
     print("Database initialized")
     yield
-    # Shutdown: cleanup if needed
-    pass
+    # Shutdown: flush queued log records
+    for handler in logging.getLogger().handlers[:]:
+        if isinstance(handler, _DeferredQueueHandler):
+            logging.getLogger().removeHandler(handler)
+    log_listener.stop()
 
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Crime Investigation GPT API",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # CORS configuration
@@ -92,23 +133,19 @@ class ClearResponse(BaseModel):
 def extract_text_from_file(file: UploadFile) -> str:
     """Extract text from uploaded files (PDF, DOCX, TXT)"""
     try:
-        file_content = file.file.read()
-        file.file.seek(0)
-        
+        # Parsers read the spooled upload directly instead of a BytesIO copy
         if file.filename.endswith('.pdf'):
-            pdf_reader = PyPDF2.PdfReader(BytesIO(file_content))
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text.strip()
+            pdf_reader = PdfReader(file.file)
+            pages = [page.extract_text() or "" for page in pdf_reader.pages]
+            return "\n".join(pages).strip()
         
         elif file.filename.endswith('.docx'):
-            doc = Document(BytesIO(file_content))
-            text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
+            doc = Document(file.file)
+            text = "\n".join(paragraph.text for paragraph in doc.paragraphs)
             return text.strip()
         
         elif file.filename.endswith('.txt'):
-            return file_content.decode('utf-8')
+            return file.file.read().decode('utf-8')
         
         else:
             return f"[File: {file.filename} - Type not supported for text extraction]"
@@ -117,23 +154,6 @@ def extract_text_from_file(file: UploadFile) -> str:
         return f"[Error extracting text from {file.filename}: {str(e)}]"
 
 
-def load_graph_from_case(case: Case) -> CrimeGraph:
-    """Load a CrimeGraph from case's stored JSON."""
-    graph = CrimeGraph()
-    if case.graph_json:
-        try:
-            data = json.loads(case.graph_json)
-            graph.from_json(data)
-        except (json.JSONDecodeError, Exception) as e:
-            print(f"Error loading graph: {e}")
-    return graph
-
-
-def save_graph_to_case(case: Case, graph: CrimeGraph) -> None:
-    """Save a CrimeGraph to case's JSON field."""
-    case.graph_json = json.dumps(graph.to_json())
-
-
 # ==================== REST API Endpoints ====================
 
 @app.get("/")
@@ -148,7 +168,8 @@ async def upload_file(
 ):
     """Upload and extract text from a file (protected)"""
     try:
-        extracted_text = extract_text_from_file(file)
+        # Parsing is blocking, so keep it off the event loop
+        extracted_text = await anyio.to_thread.run_sync(extract_text_from_file, file)
         return {
             "filename": file.filename,
             "text": extracted_text,
@@ -171,12 +192,9 @@ async def chat(
     """
     try:
         # Verify case belongs to user
-        result = await db.execute(
-            select(Case).where(Case.id == case_id, Case.user_id == current_user.id)
-        )
-        case = result.scalar_one_or_none()
+        case = await db.get(Case, case_id)
         
-        if not case:
+        if not case or case.user_id != current_user.id:
             raise HTTPException(status_code=404, detail="Case not found")
         
         # Combine message with file content if provided
@@ -184,54 +202,55 @@ async def chat(
         if chat_message.file_content:
             user_message = f"{chat_message.message}\n\nFile Content:\n{chat_message.file_content}"
         
-        # Load graph for this case
-        graph = load_graph_from_case(case)
-        
-        # Get existing entities for context
-        existing_entities = graph.get_all_entities()
-        
-        # Extract entities and relations
-        extraction = analyst.extract_entities(user_message, existing_entities)
-        
-        # Update graph
-        graph_updated = False
-        if isinstance(extraction, dict):
-            for entity in extraction.get('entities', []):
-                name = entity.get('name')
-                if name:
-                    graph.add_entity(
-                        name,
-                        entity.get('type'),
-                        entity.get('attributes')
-                    )
-                    graph_updated = True
+        # Load graph for this case; updates to it are serialized per case
+        async with locked_case_graph(db, case) as graph:
             
-            for relation in extraction.get('relations', []):
-                source = relation.get('source')
-                target = relation.get('target')
-                if source and target:
-                    graph.add_relation(
-                        source,
-                        target,
-                        relation.get('relation_type')
-                    )
-                    graph_updated = True
-        
-        # Save graph back to case
-        save_graph_to_case(case, graph)
-        
-        # Analyze the case
-        graph_context = graph.to_json()
-        analysis = analyst.analyze_case(user_message, graph_context)
-        
-        # Save messages to database
-        user_msg = Message(case_id=case.id, role="user", content=chat_message.message)
-        assistant_msg = Message(case_id=case.id, role="assistant", content=analysis)
-        db.add(user_msg)
-        db.add(assistant_msg)
-        db.add(case)  # Ensure graph_json changes are persisted
-        
-        await db.commit()
+            # Get existing entities for context
+            existing_entities = graph.get_all_entities()
+            
+            # Extract entities and relations
+            extraction = await analyst.extract_entities_chunked(user_message, existing_entities)
+            
+            # Update graph
+            graph_updated = False
+            if isinstance(extraction, dict):
+                for entity in extraction.get('entities', []):
+                    name = entity.get('name')
+                    if name:
+                        graph.add_entity(
+                            name,
+                            entity.get('type'),
+                            entity.get('attributes')
+                        )
+                        graph_updated = True
+            
+                for relation in extraction.get('relations', []):
+                    source = relation.get('source')
+                    target = relation.get('target')
+                    if source and target:
+                        graph.add_relation(
+                            source,
+                            target,
+                            relation.get('relation_type')
+                        )
+                        graph_updated = True
+            
+            # Stage new and updated entities/relations; nothing to write otherwise
+            if graph_updated:
+                await save_case_graph(db, case, graph)
+            
+            # Analyze the case
+            graph_context = graph.to_json()
+            analysis = await analyst.analyze_case_async(user_message, graph_context)
+            
+            # Save messages to database
+            user_msg = Message(case_id=case.id, role="user", content=chat_message.message)
+            assistant_msg = Message(case_id=case.id, role="assistant", content=analysis)
+            db.add_all([user_msg, assistant_msg])
+            # The turn touches no cases column itself, so bump the listing order explicitly
+            case.updated_at = func.now()
+            
+            await db.commit()
         
         return ChatResponse(
             user_message=chat_message.message,
@@ -242,9 +261,7 @@ async def chat(
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"ERROR in chat endpoint: {str(e)}")
+        logger.exception("Error in chat endpoint")
         raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
 
 
@@ -259,16 +276,13 @@ async def get_graph(
     """
     try:
         # Verify case belongs to user
-        result = await db.execute(
-            select(Case).where(Case.id == case_id, Case.user_id == current_user.id)
-        )
-        case = result.scalar_one_or_none()
+        case = await db.get(Case, case_id)
         
-        if not case:
+        if not case or case.user_id != current_user.id:
             raise HTTPException(status_code=404, detail="Case not found")
         
         # Load and return graph data
-        graph = load_graph_from_case(case)
+        graph = await load_case_graph(db, case)
         nodes_data, edges_data = graph.get_data_for_visualization()
         return GraphData(nodes=nodes_data, edges=edges_data)
     except HTTPException:
@@ -277,6 +291,35 @@ async def get_graph(
         raise HTTPException(status_code=500, detail=f"Error retrieving graph: {str(e)}")
 
 
+@app.get("/api/cases/{case_id}/analyze/stream")
+async def analyze_case_stream(
+    case_id: int,
+    message: str = Query(..., description="Situation to analyze"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Stream an analysis of the case's graph as server-sent events.
+    Each event carries {"content": "..."}; a final "done" event ends the stream.
+    Nothing is extracted or saved.
+    """
+    # Verify case belongs to user
+    case = await db.get(Case, case_id)
+    
+    if not case or case.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Case not found")
+    
+    graph = await load_case_graph(db, case)
+    graph_context = graph.to_json()
+    
+    async def events():
+        async for text in analyst.analyze_case_stream(message, graph_context):
+            yield b"data: " + orjson.dumps({"content": text}) + b"\n\n"
+        yield b"event: done\ndata: {}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
 @app.post("/api/clear", response_model=ClearResponse)
 async def clear_graph(
     case_id: int = Query(..., description="Case ID"),
@@ -288,18 +331,15 @@ async def clear_graph(
     """
     try:
         # Verify case belongs to user
-        result = await db.execute(
-            select(Case).where(Case.id == case_id, Case.user_id == current_user.id)
-        )
-        case = result.scalar_one_or_none()
+        case = await db.get(Case, case_id)
         
-        if not case:
+        if not case or case.user_id != current_user.id:
             raise HTTPException(status_code=404, detail="Case not found")
         
         # Reset graph to empty
-        empty_graph = CrimeGraph()
-        save_graph_to_case(case, empty_graph)
-        await db.commit()
+        async with locked_case_graph(db, case):
+            await clear_case_graph(db, case)
+            await db.commit()
         
         return ClearResponse(success=True, message="Knowledge graph cleared successfully")
     except HTTPException:
@@ -312,20 +352,23 @@ async def clear_graph(
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[int, List[WebSocket]] = {}  # case_id -> connections
+        self.active_connections: Dict[int, Set[WebSocket]] = {}  # case_id -> connections
 
     async def connect(self, websocket: WebSocket, case_id: int):
         await websocket.accept()
-        if case_id not in self.active_connections:
-            self.active_connections[case_id] = []
-        self.active_connections[case_id].append(websocket)
+        self.active_connections.setdefault(case_id, set()).add(websocket)
 
     def disconnect(self, websocket: WebSocket, case_id: int):
-        if case_id in self.active_connections:
-            self.active_connections[case_id].remove(websocket)
+        connections = self.active_connections.get(case_id)
+        if connections is not None:
+            connections.discard(websocket)
+            # Drop empty entries so closed cases don't accumulate
+            if not connections:
+                del self.active_connections[case_id]
 
     async def send_personal_message(self, message: dict, websocket: WebSocket):
-        await websocket.send_json(message)
+        # Text frame so browser clients can JSON.parse(event.data) directly
+        await websocket.send_text(orjson.dumps(message).decode())
 
 
 manager = ConnectionManager()
@@ -351,71 +394,83 @@ async def websocket_endpoint(
     if not user_id:
         await websocket.close(code=4001, reason="Invalid token")
         return
+    user_id = int(user_id)
     
-    # Get database session and verify case ownership
-    async with get_db() as db:
-        result = await db.execute(
-            select(Case).where(Case.id == case_id, Case.user_id == user_id)
-        )
-        case = result.scalar_one_or_none()
+    # One session for the connection's lifetime; ownership is checked here and again per message
+    async with async_session_maker() as db:
+        case = await db.get(Case, case_id)
         
-        if not case:
+        if not case or case.user_id != user_id:
             await websocket.close(code=4004, reason="Case not found")
             return
-    
-    await manager.connect(websocket, case_id)
-    try:
-        while True:
-            data = await websocket.receive_json()
-            message = data.get("message", "")
-            
-            # Echo user message back
-            await manager.send_personal_message({
-                "type": "user",
-                "content": message
-            }, websocket)
-            
-            # Process the message (simplified for WebSocket)
-            async with get_db() as db:
-                result = await db.execute(
-                    select(Case).where(Case.id == case_id)
-                )
-                case = result.scalar_one_or_none()
-                if case:
-                    graph = load_graph_from_case(case)
+        
+        # End the read transaction so the pooled connection isn't held while idle;
+        # expire_on_commit=False keeps the case loaded
+        await db.commit()
+        
+        await manager.connect(websocket, case_id)
+        try:
+            while True:
+                data = await websocket.receive_json()
+                message = data.get("message", "")
+                
+                # The case may have been deleted (and its id reused) since the last message
+                case = await db.get(Case, case_id, populate_existing=True)
+                if not case or case.user_id != user_id:
+                    await websocket.close(code=4004, reason="Case not found")
+                    return
+                
+                # Echo user message back
+                await manager.send_personal_message({
+                    "type": "user",
+                    "content": message
+                }, websocket)
+                
+                # Process the message (simplified for WebSocket)
+                async with locked_case_graph(db, case) as graph:
                     existing_entities = graph.get_all_entities()
-                    extraction = analyst.extract_entities(message, existing_entities)
+                    extraction = await analyst.extract_entities_chunked(message, existing_entities)
                     
+                    graph_updated = False
                     if isinstance(extraction, dict):
                         for entity in extraction.get('entities', []):
                             name = entity.get('name')
                             if name:
                                 graph.add_entity(name, entity.get('type'), entity.get('attributes'))
+                                graph_updated = True
                         
                         for relation in extraction.get('relations', []):
                             source = relation.get('source')
                             target = relation.get('target')
                             if source and target:
                                 graph.add_relation(source, target, relation.get('relation_type'))
+                                graph_updated = True
                     
-                    save_graph_to_case(case, graph)
+                    if graph_updated:
+                        await save_case_graph(db, case, graph)
                     
                     graph_context = graph.to_json()
-                    analysis = analyst.analyze_case(message, graph_context)
+                    analysis = await analyst.analyze_case_async(message, graph_context)
                     
                     # Save messages
-                    db.add(Message(case_id=case_id, role="user", content=message))
-                    db.add(Message(case_id=case_id, role="assistant", content=analysis))
+                    db.add_all([
+                        Message(case_id=case_id, role="user", content=message),
+                        Message(case_id=case_id, role="assistant", content=analysis),
+                    ])
+                    case.updated_at = func.now()
                     await db.commit()
-                    
-                    # Send assistant response
-                    await manager.send_personal_message({
-                        "type": "assistant",
-                        "content": analysis
-                    }, websocket)
-            
-    except WebSocketDisconnect:
-        manager.disconnect(websocket, case_id)
+                
+                # Send assistant response
+                await manager.send_personal_message({
+                    "type": "assistant",
+                    "content": analysis
+                }, websocket)
+                
+        except WebSocketDisconnect:
+            pass
+        finally:
+            # Whatever ended the loop, don't keep the socket registered
+            manager.disconnect(websocket, case_id)
 
 
 # ==================== Health Check ====================
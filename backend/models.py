@@ -3,7 +3,7 @@ Database models for the Crime Investigation GPT platform.
 """
 from datetime import datetime
 from typing import Optional, List
-from sqlalchemy import String, Text, DateTime, ForeignKey, func
+from sqlalchemy import String, Text, DateTime, ForeignKey, Index, UniqueConstraint, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from database import Base
@@ -16,6 +16,7 @@ class User(Base):
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     email: Mapped[str] = mapped_column(String(255), unique=True, index=True, nullable=False)
     hashed_password: Mapped[str] = mapped_column(String(255), nullable=False)
+    hash_scheme: Mapped[str] = mapped_column(String(20), nullable=False, server_default="legacy")  # Password pre-hash scheme
     created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
 
     # Relationships
@@ -25,22 +26,26 @@ class User(Base):
 class Case(Base):
     """Investigation case model - each case has its own graph and messages."""
     __tablename__ = "cases"
+    __table_args__ = (Index("ix_cases_user_updated", "user_id", "updated_at"),)  # Per-user listing by recency
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     title: Mapped[str] = mapped_column(String(255), nullable=False)
-    graph_json: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # Stores nx.node_link_data as JSON
+    graph_json: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # Legacy nx.node_link_data JSON, migrated to entities/relations
     created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), onupdate=func.now())
 
     # Relationships
     user: Mapped["User"] = relationship("User", back_populates="cases")
-    messages: Mapped[List["Message"]] = relationship("Message", back_populates="case", cascade="all, delete-orphan", order_by="Message.created_at")
+    messages: Mapped[List["Message"]] = relationship("Message", back_populates="case", cascade="all, delete-orphan", order_by=lambda: (Message.created_at, Message.id))
+    entities: Mapped[List["Entity"]] = relationship("Entity", back_populates="case", cascade="all, delete-orphan")
+    relations: Mapped[List["Relation"]] = relationship("Relation", back_populates="case", cascade="all, delete-orphan")
 
 
 class Message(Base):
     """Chat message model - stores conversation history per case."""
     __tablename__ = "messages"
+    __table_args__ = (Index("ix_messages_case_created", "case_id", "created_at"),)  # Per-case history in order
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     case_id: Mapped[int] = mapped_column(ForeignKey("cases.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -50,3 +55,33 @@ class Message(Base):
 
     # Relationships
     case: Mapped["Case"] = relationship("Case", back_populates="messages")
+
+
+class Entity(Base):
+    """Knowledge graph node - one row per entity in a case's graph."""
+    __tablename__ = "entities"
+    __table_args__ = (UniqueConstraint("case_id", "name"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    case_id: Mapped[int] = mapped_column(ForeignKey("cases.id", ondelete="CASCADE"), nullable=False, index=True)
+    name: Mapped[str] = mapped_column(String(255), nullable=False)
+    type: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    attrs_json: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # Remaining node attributes as JSON
+
+    # Relationships
+    case: Mapped["Case"] = relationship("Case", back_populates="entities")
+
+
+class Relation(Base):
+    """Knowledge graph edge - one row per distinct relation between two entities."""
+    __tablename__ = "relations"
+    __table_args__ = (UniqueConstraint("case_id", "source", "target", "relation_type"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    case_id: Mapped[int] = mapped_column(ForeignKey("cases.id", ondelete="CASCADE"), nullable=False, index=True)
+    source: Mapped[str] = mapped_column(String(255), nullable=False)
+    target: Mapped[str] = mapped_column(String(255), nullable=False)
+    relation_type: Mapped[str] = mapped_column(String(255), nullable=False)
+
+    # Relationships
+    case: Mapped["Case"] = relationship("Case", back_populates="relations")
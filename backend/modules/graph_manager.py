@@ -1,15 +1,47 @@
-import networkx as nx
-import json
+from collections import defaultdict
 
 class CrimeGraph:
     def __init__(self):
-        self.graph = nx.Graph()
+        # Undirected graph as plain dicts: name -> attributes, and
+        # name -> neighbour -> edge attributes (shared by both directions)
+        self.nodes = {}
+        self.adj = {}
+        # Lookup indices for node_exists: normalized name -> node, token -> nodes,
+        # node -> frozenset of its normalized tokens, and node -> insertion position
+        self._norm_to_node = {}
+        self._token_to_nodes = defaultdict(set)
+        self._node_tokens = {}
+        self._node_order = {}
+        # Nodes (a dict kept in insertion order, values unused) and edges touched
+        # since load, so callers can persist only the delta in graph order
+        self._changed_nodes = {}
+        self._new_edges = []
+        # to_json output, reused until the graph is next mutated or reloaded
+        self._cached_json = None
 
     def _normalize_name(self, name):
         """Normalize entity name for consistent matching (case-insensitive, strip whitespace)."""
         if name is None:
             return ""
-        return str(name).strip().lower()
+        return str(name).strip().casefold()
+
+    def _index_node(self, node):
+        """Register a node in the name lookup indices."""
+        normalized = self._normalize_name(node)
+        self._norm_to_node.setdefault(normalized, node)
+        tokens = frozenset(normalized.split())
+        self._node_tokens[node] = tokens
+        self._node_order.setdefault(node, len(self._node_order))
+        for token in tokens:
+            self._token_to_nodes[token].add(node)
+
+    def _rebuild_index(self):
+        self._norm_to_node = {}
+        self._token_to_nodes = defaultdict(set)
+        self._node_tokens = {}
+        self._node_order = {}
+        for node in self.nodes:
+            self._index_node(node)
 
     def node_exists(self, name):
         """Check if a node with the given name already exists in the graph.
@@ -19,43 +51,46 @@ class CrimeGraph:
             return None
         normalized_name = self._normalize_name(name)
         
-        # First pass: exact match (case-insensitive)
-        for node in self.graph.nodes():
-            if self._normalize_name(node) == normalized_name:
-                return node
+        # Exact match (case-insensitive)
+        node = self._norm_to_node.get(normalized_name)
+        if node is not None:
+            return node
+        
+        query_tokens = frozenset(normalized_name.split())
+        if not query_tokens:
+            return None
         
-        # Second pass: check if name is a partial match of existing node
+        # Partial match: nodes containing every part of the query name
         # e.g., "Michael" should match "Michael Chen"
-        name_parts = normalized_name.split()
-        for node in self.graph.nodes():
-            node_normalized = self._normalize_name(node)
-            node_parts = node_normalized.split()
-            
-            # Check if all parts of the query name exist in the node name
-            if all(part in node_parts for part in name_parts):
-                # Return the more complete name (longer one)
-                if len(node_parts) >= len(name_parts):
-                    return node
-            
-            # Check if all parts of the node name exist in query name
-            # This handles "Michael Chen" matching when we query "Chen"
-            if all(part in name_parts for part in node_parts):
-                if len(name_parts) > len(node_parts):
-                    # The query is more complete, we'll create it as new
-                    # But if it's a single word matching multi-word, use existing
-                    if len(name_parts) == 1 or len(node_parts) > 1:
-                        return node
+        candidates = set.intersection(
+            *(self._token_to_nodes.get(token, set()) for token in query_tokens)
+        )
+        if candidates:
+            # Fewest extra parts wins, ties going to the earliest-added node
+            return min(candidates, key=lambda n: (len(self._node_tokens[n]), self._node_order[n]))
+        
+        # Multi-word nodes whose parts all appear in the query name
+        # e.g., "Michael Chen Jr" should match "Michael Chen"
+        matches = []
+        for node in set().union(*(self._token_to_nodes.get(token, ()) for token in query_tokens)):
+            node_tokens = self._node_tokens[node]
+            if len(node_tokens) > 1 and node_tokens <= query_tokens:
+                matches.append(node)
+        if matches:
+            # Most complete name wins, ties going to the earliest-added node
+            return min(matches, key=lambda n: (-len(self._node_tokens[n]), self._node_order[n]))
         
         return None
 
     def get_all_entities(self):
         """Returns a list of all entity names in the graph."""
-        return list(self.graph.nodes())
+        return list(self.nodes)
 
     def add_entity(self, name, entity_type, attributes=None):
         """Adds a node to the graph, or updates it if it already exists."""
         if not name:  # Skip None or empty names
             return
+        self._cached_json = None
             
         # Ensure attributes is a dictionary
         if attributes is None:
@@ -72,7 +107,7 @@ class CrimeGraph:
         
         if existing_node:
             # Node exists - merge/update attributes
-            current_attrs = self.graph.nodes[existing_node]
+            current_attrs = self.nodes[existing_node]
             
             # Update type if it's more specific or first time set
             if entity_type and (not current_attrs.get('type') or current_attrs.get('type') == 'Unknown'):
@@ -96,17 +131,21 @@ class CrimeGraph:
                         current_attrs[key] = [current_attrs[key]] + value
                     else:
                         current_attrs[key] = [current_attrs[key], value]
+            self._changed_nodes[existing_node] = None
         else:
             # New node - add it
             attributes['type'] = entity_type
             attributes['label'] = name
-            self.graph.add_node(name, **attributes)
+            self._add_node(name, attributes)
+            self._index_node(name)
+            self._changed_nodes[name] = None
 
     def add_relation(self, source, target, relation_type, attributes=None):
         """Adds an edge to the graph, ensuring entities exist with normalized names."""
         if attributes is None:
             attributes = {}
         attributes['relation'] = relation_type
+        self._cached_json = None
         
         # Find actual node names (handling case variations)
         actual_source = self.node_exists(source)
@@ -121,7 +160,55 @@ class CrimeGraph:
             self.add_entity(target, "Unknown")
             actual_target = target
         
-        self.graph.add_edge(actual_source, actual_target, **attributes)
+        self._add_edge(actual_source, actual_target, attributes)
+        self._new_edges.append((actual_source, actual_target, relation_type))
+
+    def pop_changes(self):
+        """
+        Returns the nodes and edges added or updated since the graph was loaded
+        (or since the last call) and resets the tracking.
+        Nodes map name -> attributes; edges are (source, target, relation) tuples.
+        """
+        nodes = {name: dict(self.nodes[name]) for name in self._changed_nodes}
+        edges = self._new_edges
+        self._changed_nodes = {}
+        self._new_edges = []
+        return nodes, edges
+
+    def mark_all_changed(self):
+        """Flags every node and edge as changed, e.g. to migrate a graph to new storage."""
+        self._changed_nodes = dict.fromkeys(self.nodes)
+        self._new_edges = [
+            (source, target, data.get('relation'))
+            for source, target, data in self._iter_edges()
+        ]
+
+    def _add_node(self, name, attributes):
+        if name in self.nodes:
+            self.nodes[name].update(attributes)
+        else:
+            self.nodes[name] = dict(attributes)
+            self.adj[name] = {}
+
+    def _add_edge(self, source, target, attributes):
+        for node in (source, target):
+            if node not in self.nodes:
+                self._add_node(node, {})
+        data = self.adj[source].get(target)
+        if data is None:
+            data = {}
+            self.adj[source][target] = data
+            self.adj[target][source] = data
+        data.update(attributes)
+
+    def _iter_edges(self):
+        """Yields each undirected edge once as (source, target, attributes)."""
+        seen = set()
+        for node, neighbours in self.adj.items():
+            for neighbour, data in neighbours.items():
+                if neighbour not in seen:
+                    yield node, neighbour, data
+            seen.add(node)
 
     def get_context_subgraph(self, query_entities=None, depth=1):
         """
@@ -129,17 +216,22 @@ class CrimeGraph:
         If query_entities is None, returns the whole graph.
         """
         if not query_entities:
-            return self.graph
+            return self
         
         nodes = set()
         for entity in query_entities:
-            if entity in self.graph:
+            if entity in self.nodes:
                 nodes.add(entity)
                 # Add neighbors up to depth
                 # For simple depth 1:
-                nodes.update(self.graph.neighbors(entity))
+                nodes.update(self.adj[entity])
         
-        return self.graph.subgraph(nodes)
+        subgraph = CrimeGraph()
+        subgraph._load(
+            ((name, data) for name, data in self.nodes.items() if name in nodes),
+            ((s, t, data) for s, t, data in self._iter_edges() if s in nodes and t in nodes),
+        )
+        return subgraph
 
     def get_data_for_visualization(self):
         """
@@ -148,7 +240,7 @@ class CrimeGraph:
         nodes = []
         edges = []
         
-        for node, data in self.graph.nodes(data=True):
+        for node, data in self.nodes.items():
             nodes.append({
                 "id": node,
                 "label": data.get('label', node),
@@ -156,7 +248,7 @@ class CrimeGraph:
                 "color": self._get_color_by_type(data.get('type'))
             })
             
-        for source, target, data in self.graph.edges(data=True):
+        for source, target, data in self._iter_edges():
             edges.append({
                 "source": source,
                 "target": target,
@@ -176,7 +268,55 @@ class CrimeGraph:
         return colors.get(entity_type, "#808080")
 
     def to_json(self):
-        return nx.node_link_data(self.graph)
+        """
+        Returns {"nodes": [...], "edges": [...]} with ids/endpoints inlined into each entry.
+        The result is cached until the next mutation; callers must not modify it.
+        """
+        if self._cached_json is None:
+            self._cached_json = {
+                "nodes": [dict(data, id=node) for node, data in self.nodes.items()],
+                "edges": [
+                    dict(data, source=source, target=target)
+                    for source, target, data in self._iter_edges()
+                ],
+            }
+        return self._cached_json
 
     def from_json(self, data):
-        self.graph = nx.node_link_graph(data)
+        """Loads to_json output; networkx node-link data (edges under "links") is also accepted."""
+        self._load(
+            (
+                (node['id'], {key: value for key, value in node.items() if key != 'id'})
+                for node in data.get('nodes', [])
+            ),
+            (
+                (
+                    edge['source'],
+                    edge['target'],
+                    {key: value for key, value in edge.items() if key not in ('source', 'target')},
+                )
+                for edge in data.get('edges', data.get('links', []))
+            ),
+        )
+
+    def from_records(self, nodes, edges):
+        """
+        Rebuilds the graph from stored rows.
+        nodes: iterable of (name, attributes); edges: iterable of (source, target, relation).
+        """
+        self._load(
+            nodes,
+            ((source, target, {'relation': relation}) for source, target, relation in edges),
+        )
+
+    def _load(self, nodes, edges):
+        self.nodes = {}
+        self.adj = {}
+        for name, attributes in nodes:
+            self._add_node(name, attributes)
+        for source, target, attributes in edges:
+            self._add_edge(source, target, attributes)
+        self._rebuild_index()
+        self._changed_nodes = {}
+        self._new_edges = []
+        self._cached_json = None
@@ -1,8 +1,16 @@
 import os
-import json
+import re
+import logging
+import asyncio
+import hashlib
+import threading
+import orjson
 import google.generativeai as genai
+from cachetools import LRUCache
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
+
+logger = logging.getLogger(__name__)
 
 # Define data structures for extraction
 class Entity(BaseModel):
@@ -19,10 +27,136 @@ class ExtractionResult(BaseModel):
     entities: List[Entity]
     relations: List[Relation]
 
+# Long inputs are extracted in chunks of about this many characters, up to
+# EXTRACTION_BATCH_SIZE chunks per Gemini call, with at most
+# EXTRACTION_CONCURRENCY calls in flight per request
+EXTRACTION_CHUNK_CHARS = 8000
+EXTRACTION_BATCH_SIZE = 8
+EXTRACTION_CONCURRENCY = 4
+
+# Most existing entity names sent along with an extraction prompt
+MAX_CONTEXT_ENTITIES = 50
+
+# Successful extraction results kept per analyst, keyed by a digest of the inputs
+EXTRACTION_CACHE_SIZE = 2048
+
+_WORD_RE = re.compile(r"\w+")
+# Outermost {...} span, for responses with text around the JSON object
+_JSON_OBJ_RE = re.compile(r'\{[\s\S]*\}')
+
+
+# System prompts are constant so the model instance and Gemini's prefix
+# caching are shared across calls; per-call context goes in the user message
+_ENTITY_MATCHING_RULES = """If the message lists existing KNOWLEDGE GRAPH entities:
+1. If an extracted entity matches an existing one, use the EXACT SAME NAME.
+2. Match names semantically (e.g. "Mike" -> "Michael Smith").
+"""
+
+EXTRACTION_SYSTEM_PROMPT = """You are an expert crime analyst. Extract entities and relations from the text to build a knowledge graph.
+
+output MUST be a JSON object with this structure:
+{
+  "entities": [
+    {"name": "Entity Name", "type": "Person|Location|Event|Object|Organization", "attributes": { "role": "..." } }
+  ],
+  "relations": [
+    {"source": "Entity Name", "target": "Entity Name", "relation_type": "verb_phrase"}
+  ]
+}
+
+Entity Types: Person, Location, Event, Object, Organization.
+Include attributes like age, role, time, etc in attributes dict.
+
+""" + _ENTITY_MATCHING_RULES
+
+BATCH_EXTRACTION_SYSTEM_PROMPT = """You are an expert crime analyst. The text is split into chunks, each introduced by a "---CHUNK n---" line. Extract entities and relations from each chunk separately to build a knowledge graph.
+
+output MUST be a JSON object with one entry per chunk, in this structure:
+{
+  "results": [
+    {
+      "chunk_id": 0,
+      "entities": [
+        {"name": "Entity Name", "type": "Person|Location|Event|Object|Organization", "attributes": { "role": "..." } }
+      ],
+      "relations": [
+        {"source": "Entity Name", "target": "Entity Name", "relation_type": "verb_phrase"}
+      ]
+    }
+  ]
+}
+
+Entity Types: Person, Location, Event, Object, Organization.
+Include attributes like age, role, time, etc in attributes dict.
+
+""" + _ENTITY_MATCHING_RULES
+
+ANALYSIS_SYSTEM_PROMPT = "You are a senior detective AI. Analyze the situation and legal knowledge graph."
+
+
+def select_context_entities(existing_entities, text, limit=MAX_CONTEXT_ENTITIES):
+    """
+    Picks the existing entity names worth sending with an extraction prompt.
+    Names are deduplicated case-insensitively; those sharing a word with text
+    come first, in graph order, and the result is capped at limit.
+    """
+    if not existing_entities:
+        return []
+
+    unique = {}
+    for name in existing_entities:
+        normalized = str(name).strip().casefold()
+        if normalized and normalized not in unique:
+            unique[normalized] = name
+
+    text_words = set(_WORD_RE.findall(text.casefold()))
+    relevant = []
+    others = []
+    for normalized, name in unique.items():
+        if text_words.intersection(_WORD_RE.findall(normalized)):
+            relevant.append(name)
+        else:
+            others.append(name)
+    return (relevant + others)[:limit]
+
+
+def _extraction_cache_key(text, existing_entities):
+    entities = "\x1f".join(sorted(set(existing_entities or ())))
+    return hashlib.blake2b(f"{text}\0{entities}".encode('utf-8'), digest_size=16).digest()
+
+
+def split_into_chunks(text, max_chars=EXTRACTION_CHUNK_CHARS):
+    """Splits text on paragraph boundaries into chunks of at most max_chars characters."""
+    chunks = []
+    current = ""
+    for paragraph in text.split("\n\n"):
+        # Paragraphs longer than a chunk are cut at max_chars
+        while len(paragraph) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + 2 + len(paragraph) > max_chars:
+            chunks.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
 class CrimeAnalyst:
     def __init__(self, provider="google", api_key=None, model_name=None):
         self.provider = provider
         self.model_name = model_name or "gemini-flash-latest"
+        # GenerativeModel instances keyed by (model_name, system_instruction, temperature, max_tokens, json_mode)
+        self._model_cache = LRUCache(maxsize=8)
+        self._model_cache_lock = threading.Lock()
+        # Serialized extraction results; stored as JSON bytes so callers get their own copy
+        self._extraction_cache = LRUCache(maxsize=EXTRACTION_CACHE_SIZE)
+        self._extraction_cache_lock = threading.Lock()
         self.client_ready = self._initialize_client(provider, api_key)
         
     def _initialize_client(self, provider, api_key):
@@ -55,6 +189,65 @@ class CrimeAnalyst:
             
         return False
 
+    def _get_model(self, system_instruction, temperature, max_tokens, json_mode):
+        """Returns a cached GenerativeModel for these settings, creating it on first use."""
+        key = (self.model_name, system_instruction, temperature, max_tokens, json_mode)
+        with self._model_cache_lock:
+            model = self._model_cache.get(key)
+        if model is not None:
+            return model
+
+        generation_config = {
+            "temperature": temperature,
+            "max_output_tokens": max_tokens,
+        }
+
+        if json_mode:
+            generation_config["response_mime_type"] = "application/json"
+
+        model = genai.GenerativeModel(
+            model_name=self.model_name,
+            system_instruction=system_instruction,
+            generation_config=generation_config
+        )
+        with self._model_cache_lock:
+            self._model_cache[key] = model
+        return model
+
+    def _gemini_request(self, messages, temperature, max_tokens, json_mode):
+        """Builds the Gemini model and prompt for a [system, user] message list."""
+        # Extract system prompt if present
+        system_instruction = None
+        chat_history = []
+        last_user_message = ""
+
+        for msg in messages:
+            if msg["role"] == "system":
+                system_instruction = msg["content"]
+            elif msg["role"] == "user":
+                last_user_message = msg["content"]
+                chat_history.append({"role": "user", "parts": [msg["content"]]})
+            elif msg["role"] == "assistant":
+                chat_history.append({"role": "model", "parts": [msg["content"]]})
+
+        # Gemini doesn't support chat history in the generate_content call directly like this
+        # For this simple implementation where we usually have 1 system + 1 user, or system + history + user
+        # We will instantiate the model with system instruction
+
+        model = self._get_model(system_instruction, temperature, max_tokens, json_mode)
+
+        # If we have history (more than just the last message), we use confirm chat
+        # But for our use cases (extraction/analysis), it's usually stateless one-shot
+        # so we can just send the last user message or the appropriate prompt.
+
+        # For safety, if there are multiple user/assistant turns, we should use start_chat
+        # But our current usage in extract_entities/analyze_case is effectively one-shot.
+        # Let's verify messages structure.
+
+        # extract_entities: [system, user]
+        # analyze_case: [system, user]
+        return model, last_user_message
+
     def _call_llm(self, messages, temperature=0.2, max_tokens=4096, json_mode=False):
         """Call the LLM and return the response content."""
         if not self.client_ready:
@@ -63,56 +256,12 @@ class CrimeAnalyst:
             
         if self.provider == "google":
             try:
-                # Extract system prompt if present
-                system_instruction = None
-                chat_history = []
-                last_user_message = ""
-                
-                for msg in messages:
-                    if msg["role"] == "system":
-                        system_instruction = msg["content"]
-                    elif msg["role"] == "user":
-                        last_user_message = msg["content"]
-                        chat_history.append({"role": "user", "parts": [msg["content"]]})
-                    elif msg["role"] == "assistant":
-                        chat_history.append({"role": "model", "parts": [msg["content"]]})
-                
-                # Gemini doesn't support chat history in the generate_content call directly like this
-                # For this simple implementation where we usually have 1 system + 1 user, or system + history + user
-                # We will instantiate the model with system instruction
-                
-                generation_config = {
-                    "temperature": temperature,
-                    "max_output_tokens": max_tokens,
-                }
-                
-                if json_mode:
-                    generation_config["response_mime_type"] = "application/json"
-                
-                model = genai.GenerativeModel(
-                    model_name=self.model_name,
-                    system_instruction=system_instruction,
-                    generation_config=generation_config
-                )
-                
-                # If we have history (more than just the last message), we use confirm chat
-                # But for our use cases (extraction/analysis), it's usually stateless one-shot
-                # so we can just send the last user message or the appropriate prompt.
-                
-                # For safety, if there are multiple user/assistant turns, we should use start_chat
-                # But our current usage in extract_entities/analyze_case is effectively one-shot.
-                # Let's verify messages structure.
-                
-                # extract_entities: [system, user]
-                # analyze_case: [system, user]
-                
-                response = model.generate_content(last_user_message)
+                model, prompt = self._gemini_request(messages, temperature, max_tokens, json_mode)
+                response = model.generate_content(prompt)
                 return response.text
                 
             except Exception as e:
-                import traceback
-                print(f"[ERROR] Error calling Gemini: {type(e).__name__}: {e}")
-                traceback.print_exc()
+                logger.exception("Error calling Gemini: %s: %s", type(e).__name__, e)
                 return None
 
         # Fallback to Nvidia logic
@@ -128,95 +277,262 @@ class CrimeAnalyst:
                 )
                 return completion.choices[0].message.content
             except Exception as e:
-                import traceback
-                print(f"[ERROR] Error calling LLM: {type(e).__name__}: {e}")
-                traceback.print_exc()
+                logger.exception("Error calling LLM: %s: %s", type(e).__name__, e)
                 return None
         
         return None
 
+    async def _call_llm_async(self, messages, temperature=0.2, max_tokens=4096, json_mode=False):
+        """Async _call_llm; Gemini requests are awaited without blocking the event loop."""
+        if not self.client_ready:
+            print("[ERROR] LLM client not initialized.")
+            return None
+
+        if self.provider == "google":
+            try:
+                model, prompt = self._gemini_request(messages, temperature, max_tokens, json_mode)
+                response = await model.generate_content_async(prompt)
+                return response.text
+            except Exception as e:
+                logger.exception("Error calling Gemini: %s: %s", type(e).__name__, e)
+                return None
+
+        # The OpenAI-compatible client is synchronous; keep it off the event loop
+        return await asyncio.to_thread(self._call_llm, messages, temperature, max_tokens, json_mode)
+
+    def _entity_context(self, existing_entities, text):
+        entities = select_context_entities(existing_entities, text)
+        if not entities:
+            return ""
+        return f"Existing KNOWLEDGE GRAPH entities: {', '.join(entities)}\n\n"
+
+    def _extraction_messages(self, text, existing_entities):
+        entity_context = self._entity_context(existing_entities, text)
+        return [
+            {"role": "system", "content": EXTRACTION_SYSTEM_PROMPT},
+            {"role": "user", "content": f"{entity_context}Analyze this text:\n{text}"}
+        ]
+
+    def _batch_extraction_messages(self, texts, existing_entities):
+        entity_context = self._entity_context(existing_entities, "\n".join(texts))
+        chunks = "".join(f"\n---CHUNK {chunk_id}---\n{text}" for chunk_id, text in enumerate(texts))
+        return [
+            {"role": "system", "content": BATCH_EXTRACTION_SYSTEM_PROMPT},
+            {"role": "user", "content": f"{entity_context}Analyze these text chunks:{chunks}"}
+        ]
+
+    def _parse_batch_extraction(self, response, count):
+        """
+        Splits a batch response into one {entities, relations} dict per input chunk,
+        in input order. Chunks missing from the response are None.
+        """
+        results = [None] * count
+        parsed = self._load_json_response(response)
+        items = parsed.get("results", []) if isinstance(parsed, dict) else []
+        for position, item in enumerate(items):
+            if not isinstance(item, dict):
+                continue
+            chunk_id = item.get("chunk_id", position)
+            if isinstance(chunk_id, int) and 0 <= chunk_id < count:
+                results[chunk_id] = {
+                    "entities": item.get("entities", []),
+                    "relations": item.get("relations", []),
+                }
+        return results
+
+    def _load_json_response(self, response):
+        """Parses a JSON-mode LLM response, returning None if it holds no JSON object."""
+        logger.debug("Raw LLM response: %.200s", response)
+        if response:
+            # Gemini JSON mode returns pure JSON, so we can parse directly
+            try:
+                return orjson.loads(response)
+            except orjson.JSONDecodeError:
+                # Fallback for cleanup if it didn't strictly follow JSON mode (rare)
+                json_match = _JSON_OBJ_RE.search(response)
+                if json_match:
+                    return orjson.loads(json_match.group(0))
+        return None
+
+    def _get_cached_extraction(self, key):
+        with self._extraction_cache_lock:
+            cached = self._extraction_cache.get(key)
+        return orjson.loads(cached) if cached is not None else None
+
+    def _cache_extraction(self, key, result):
+        serialized = orjson.dumps(result)
+        with self._extraction_cache_lock:
+            self._extraction_cache[key] = serialized
+
+    def _lookup_batch(self, texts, existing_entities):
+        """Returns (cache keys, cached results or None, indices still to extract)."""
+        keys = [_extraction_cache_key(text, existing_entities) for text in texts]
+        results = [self._get_cached_extraction(key) for key in keys]
+        missing = [index for index, result in enumerate(results) if result is None]
+        return keys, results, missing
+
+    def _store_batch(self, keys, results, missing, extracted):
+        """Fills and caches extracted results; chunks the model skipped come back empty."""
+        for index, result in zip(missing, extracted):
+            if result is None:
+                result = {"entities": [], "relations": []}
+            else:
+                self._cache_extraction(keys[index], result)
+            results[index] = result
+        return results
+
+    def _store_extraction(self, key, response):
+        """Parses and caches a single-text extraction response; failures come back empty."""
+        try:
+            result = self._load_json_response(response)
+        except Exception:
+            logger.exception("Error in extraction")
+            result = None
+
+        if result is None:
+            return {"entities": [], "relations": []}
+        self._cache_extraction(key, result)
+        return result
+
     def extract_entities(self, text, existing_entities=None):
         """Extracts entities and relations from text, considering existing entities."""
         if not self.client_ready:
             return self._mock_extraction(text)
 
-        if existing_entities is None:
-            existing_entities = []
+        key = _extraction_cache_key(text, existing_entities)
+        cached = self._get_cached_extraction(key)
+        if cached is not None:
+            return cached
 
-        # Build context
-        entity_context = ""
-        if existing_entities:
-            entity_context = f"""
-Existing KNOWLEDGE GRAPH entities: {', '.join(existing_entities)}
-
-CRITICAL:
-1. If an extracted entity matches an existing one, use the EXACT SAME NAME.
-2. Match names semantically (e.g. "Mike" -> "Michael Smith").
-"""
+        # Use json_mode=True for Gemini
+        response = self._call_llm(self._extraction_messages(text, existing_entities), json_mode=True)
+        return self._store_extraction(key, response)
 
-        system_prompt = f"""You are an expert crime analyst. Extract entities and relations from the text to build a knowledge graph.
+    async def extract_entities_async(self, text, existing_entities=None):
+        """Async extract_entities."""
+        if not self.client_ready:
+            return self._mock_extraction(text)
 
-output MUST be a JSON object with this structure:
-{{
-  "entities": [
-    {{"name": "Entity Name", "type": "Person|Location|Event|Object|Organization", "attributes": {{ "role": "..." }} }}
-  ],
-  "relations": [
-    {{"source": "Entity Name", "target": "Entity Name", "relation_type": "verb_phrase"}}
-  ]
-}}
+        key = _extraction_cache_key(text, existing_entities)
+        cached = self._get_cached_extraction(key)
+        if cached is not None:
+            return cached
 
-Entity Types: Person, Location, Event, Object, Organization.
-Include attributes like age, role, time, etc in attributes dict.
+        response = await self._call_llm_async(self._extraction_messages(text, existing_entities), json_mode=True)
+        return self._store_extraction(key, response)
 
-{entity_context}
-"""
+    async def _extract_batch_async(self, texts, existing_entities):
+        """One extraction call for the uncached texts among up to EXTRACTION_BATCH_SIZE."""
+        keys, results, missing = self._lookup_batch(texts, existing_entities)
+        if not missing:
+            return results
+        if len(missing) == 1:
+            results[missing[0]] = await self.extract_entities_async(texts[missing[0]], existing_entities)
+            return results
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Analyze this text:\n{text}"}
-        ]
-        
+        messages = self._batch_extraction_messages([texts[index] for index in missing], existing_entities)
+        response = await self._call_llm_async(messages, max_tokens=8192, json_mode=True)
         try:
-            # Use json_mode=True for Gemini
-            response = self._call_llm(messages, json_mode=True)
-            print(f"[DEBUG] Raw LLM response: {response[:200] if response else 'None'}...")
-            
-            if response:
-                # Gemini JSON mode returns pure JSON, so we can parse directly
-                try:
-                    result = json.loads(response)
-                    # Helper to normalize if needed (Gemini usually follows schema well in JSON mode)
-                    return result
-                except json.JSONDecodeError:
-                    # Fallback for cleanup if it didn't strictly follow JSON mode (rare)
-                    import re
-                    json_match = re.search(r'\{[\s\S]*\}', response)
-                    if json_match:
-                        return json.loads(json_match.group(0))
-            
-            return {"entities": [], "relations": []}
+            extracted = self._parse_batch_extraction(response, len(missing))
+        except Exception:
+            logger.exception("Error in batch extraction")
+            extracted = [None] * len(missing)
+        return self._store_batch(keys, results, missing, extracted)
 
-        except Exception as e:
-            print(f"Error in extraction: {e}")
-            return {"entities": [], "relations": []}
+    async def extract_entities_batch_async(self, texts: List[str], existing_entities=None, max_concurrency=EXTRACTION_CONCURRENCY):
+        """
+        Extracts entities and relations from several texts, sending up to
+        EXTRACTION_BATCH_SIZE of them per LLM call. Batches run concurrently,
+        at most max_concurrency at a time; a failed batch yields empty results.
+        Returns one {entities, relations} dict per text, in input order.
+        """
+        if not self.client_ready:
+            return [self._mock_extraction(text) for text in texts]
+
+        batches = [texts[start:start + EXTRACTION_BATCH_SIZE] for start in range(0, len(texts), EXTRACTION_BATCH_SIZE)]
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def extract_batch(batch):
+            async with semaphore:
+                return await self._extract_batch_async(batch, existing_entities)
+
+        batch_results = await asyncio.gather(*(extract_batch(batch) for batch in batches), return_exceptions=True)
+
+        results = []
+        for batch, batch_result in zip(batches, batch_results):
+            if isinstance(batch_result, Exception):
+                logger.error("Error in batch extraction", exc_info=batch_result)
+                batch_result = [{"entities": [], "relations": []} for _ in batch]
+            results.extend(batch_result)
+        return results
+
+    async def extract_entities_chunked(self, text, existing_entities=None, max_concurrency=EXTRACTION_CONCURRENCY):
+        """
+        Extracts from long text by splitting it into chunks, extracting them in
+        concurrent batches and merging their entities and relations.
+        """
+        chunks = split_into_chunks(text)
+        if len(chunks) <= 1:
+            return await self.extract_entities_async(text, existing_entities)
+
+        merged = {"entities": [], "relations": []}
+        for result in await self.extract_entities_batch_async(chunks, existing_entities, max_concurrency):
+            if isinstance(result, dict):
+                merged["entities"].extend(result.get("entities", []))
+                merged["relations"].extend(result.get("relations", []))
+        return merged
 
     def analyze_case(self, current_situation, graph_context):
         """Analyzes the case and suggests next steps."""
         if not self.client_ready:
             return self._mock_analysis(current_situation)
 
-        messages = [
-            {"role": "system", "content": "You are a senior detective AI. Analyze the situation and legal knowledge graph."},
-            {"role": "user", "content": f"Situation: {current_situation}\n\nGraph Context: {json.dumps(graph_context)}\n\nProvide:\n1. Analysis\n2. Potential leads\n3. Next steps"}
-        ]
-        
+        messages = self._analysis_messages(current_situation, graph_context)
         try:
             response = self._call_llm(messages, max_tokens=8192)
             return response if response else self._mock_analysis(current_situation)
         except Exception as e:
             return f"Error in analysis: {e}"
 
+    async def analyze_case_async(self, current_situation, graph_context):
+        """Async analyze_case."""
+        if not self.client_ready:
+            return self._mock_analysis(current_situation)
+
+        messages = self._analysis_messages(current_situation, graph_context)
+        try:
+            response = await self._call_llm_async(messages, max_tokens=8192)
+            return response if response else self._mock_analysis(current_situation)
+        except Exception as e:
+            return f"Error in analysis: {e}"
+
+    async def analyze_case_stream(self, current_situation, graph_context) -> AsyncIterator[str]:
+        """Like analyze_case_async, but yields the analysis text as Gemini generates it."""
+        if not self.client_ready:
+            yield self._mock_analysis(current_situation)
+            return
+
+        if self.provider != "google":
+            yield await self.analyze_case_async(current_situation, graph_context)
+            return
+
+        messages = self._analysis_messages(current_situation, graph_context)
+        try:
+            model, prompt = self._gemini_request(messages, 0.2, 8192, False)
+            response = await model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            logger.exception("Error streaming from Gemini: %s: %s", type(e).__name__, e)
+            yield f"Error in analysis: {e}"
+
+    def _analysis_messages(self, current_situation, graph_context):
+        return [
+            {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Situation: {current_situation}\n\nGraph Context: {orjson.dumps(graph_context).decode()}\n\nProvide:\n1. Analysis\n2. Potential leads\n3. Next steps"}
+        ]
+
     def _mock_extraction(self, text):
         return {
             "entities": [{"name": "Mock Entity", "type": "Person", "attributes": {}}],
@@ -4,30 +4,31 @@ def get_agraph_config(nodes_data, edges_data):
     """
     Converts raw node/edge data into streamlit-agraph objects.
     """
-    nodes = []
-    edges = []
-    
-    for n in nodes_data:
-        nodes.append(Node(
+    nodes = [
+        Node(
             id=n['id'],
             label=n['label'],
             size=25,
             color=n['color'],
             title=f"Type: {n['type']}" # Tooltip
-        ))
-        
-    for e in edges_data:
-        edges.append(Edge(
+        )
+        for n in nodes_data
+    ]
+    
+    edges = [
+        Edge(
             source=e['source'],
             target=e['target'],
             label=e['label'],
             type="CURVE_SMOOTH"
-        ))
+        )
+        for e in edges_data
+    ]
         
     config = Config(
         width=800,
         height=600,
-        directed=False,  # Using undirected graph to match nx.Graph
+        directed=False,  # Using undirected graph to match CrimeGraph
         physics=True, 
         hierarchical=False,
         nodeHighlightBehavior=True,
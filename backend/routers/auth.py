@@ -1,26 +1,36 @@
 """
 Authentication routes for user registration and login.
 """
+import logging
 from datetime import timedelta
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, EmailStr
-from sqlalchemy import select
+from sqlalchemy import select, bindparam, lambda_stmt
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
 from models import User
 from auth import (
-    hash_password,
-    verify_password,
+    ahash_password,
+    averify_password,
+    password_needs_rehash,
+    DUMMY_PASSWORD_HASH,
     create_access_token,
     get_current_user,
     ACCESS_TOKEN_EXPIRE_DAYS,
+    HASH_SCHEME,
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
+# Built once and executed with a bound email parameter
+_user_by_email = lambda_stmt(lambda: select(User).where(User.email == bindparam("email")))
+
 
 # Pydantic schemas
 class UserRegister(BaseModel):
@@ -52,25 +62,20 @@ async def register(user_data: UserRegister, db: AsyncSession = Depends(get_db)):
     Register a new user account.
     Returns a JWT access token on successful registration.
     """
-    import traceback
     try:
-        # Check if email already exists
-        result = await db.execute(select(User).where(User.email == user_data.email))
-        existing_user = result.scalar_one_or_none()
-        
-        if existing_user:
+        # Create new user; the unique email index rejects duplicates in the same INSERT
+        hashed_pw = await ahash_password(user_data.password)
+        new_user = User(email=user_data.email, hashed_password=hashed_pw, hash_scheme=HASH_SCHEME)
+        db.add(new_user)
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already registered"
             )
         
-        # Create new user
-        hashed_pw = hash_password(user_data.password)
-        new_user = User(email=user_data.email, hashed_password=hashed_pw)
-        db.add(new_user)
-        await db.commit()
-        await db.refresh(new_user)
-        
         # Generate access token
         access_token = create_access_token(
             data={"sub": str(new_user.id)},
@@ -81,8 +86,7 @@ async def register(user_data: UserRegister, db: AsyncSession = Depends(get_db)):
     except HTTPException:
         raise
     except Exception as e:
-        traceback.print_exc()
-        print(f"Registration error: {str(e)}")
+        logger.exception("Registration error")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -93,16 +97,29 @@ async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     Returns a JWT access token on successful login.
     """
     # Find user by email
-    result = await db.execute(select(User).where(User.email == user_data.email))
+    result = await db.execute(_user_by_email, {"email": user_data.email})
     user = result.scalar_one_or_none()
     
-    if not user or not verify_password(user_data.password, user.hashed_password):
+    if user is None:
+        # Spend the same bcrypt time as a real check so timing doesn't reveal registered emails
+        await averify_password(user_data.password, DUMMY_PASSWORD_HASH)
+        verified = False
+    else:
+        verified = await averify_password(user_data.password, user.hashed_password, user.hash_scheme)
+    
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Upgrade hashes created under an older scheme or bcrypt cost
+    if password_needs_rehash(user.hashed_password, user.hash_scheme):
+        user.hashed_password = await ahash_password(user_data.password)
+        user.hash_scheme = HASH_SCHEME
+        await db.commit()
+    
     # Generate access token
     access_token = create_access_token(
         data={"sub": str(user.id)},
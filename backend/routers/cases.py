@@ -1,21 +1,70 @@
 """
 Case management routes for creating, listing, and managing investigation cases.
 """
-import json
+import base64
+from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel
-from sqlalchemy import select
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import DateTime, select, bindparam, lambda_stmt, or_
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import joinedload, load_only
 
 from database import get_db
 from models import User, Case, Message
 from auth import get_current_user
+from graph_store import invalidate_case_graph
 
 router = APIRouter(prefix="/api/cases", tags=["cases"])
 
+# Cursor timestamps are bound in the format SQLite's CURRENT_TIMESTAMP stores
+# (no microseconds), so keyset comparisons match the stored text exactly
+_CURSOR_TIMESTAMP = DateTime().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
+
+# Hot-path statements, built once and executed with bound parameters
+# Case pages, newest first. Only the listed columns are loaded, so graph_json
+# never leaves the database. Later pages are keyset-paginated on
+# (updated_at, id) after the last case of the previous page, whose values
+# travel in the cursor so the page doesn't depend on that case being unchanged.
+_CASES_PAGE_COLUMNS = (Case.id, Case.title, Case.created_at, Case.updated_at)
+_CASES_PAGE_ORDER = (Case.updated_at.desc(), Case.id.desc())
+
+_cases_first_page = lambda_stmt(
+    lambda: select(*_CASES_PAGE_COLUMNS)
+    .where(Case.user_id == bindparam("uid"))
+    .order_by(*_CASES_PAGE_ORDER)
+    .limit(bindparam("limit"))
+)
+
+
+def _cases_after_cursor():
+    after_updated = bindparam("after_updated", type_=_CURSOR_TIMESTAMP)
+    return (
+        select(*_CASES_PAGE_COLUMNS)
+        .where(
+            Case.user_id == bindparam("uid"),
+            Case.updated_at <= after_updated,
+            or_(Case.updated_at < after_updated, Case.id < bindparam("after_id")),
+        )
+        .order_by(*_CASES_PAGE_ORDER)
+        .limit(bindparam("limit"))
+    )
+
+
+_cases_next_page = lambda_stmt(_cases_after_cursor)
+_case_for_user = lambda_stmt(
+    lambda: select(Case).where(Case.id == bindparam("cid"), Case.user_id == bindparam("uid"))
+)
+_messages_for_case = lambda_stmt(
+    lambda: select(Message).where(Message.case_id == bindparam("cid")).order_by(Message.created_at, Message.id)
+)
+
 
 # Pydantic schemas
 class CaseCreate(BaseModel):
@@ -25,58 +74,83 @@ class CaseCreate(BaseModel):
 class CaseResponse(BaseModel):
     id: int
     title: str
-    created_at: str
-    updated_at: str
+    created_at: datetime
+    updated_at: datetime
 
     class Config:
         from_attributes = True
 
 
-class CaseDetailResponse(BaseModel):
-    id: int
-    title: str
-    created_at: str
-    updated_at: str
-    messages: List["MessageResponse"]
+class CasePage(BaseModel):
+    items: List[CaseResponse]
+    next_cursor: Optional[str] = None  # Pass back as ?cursor= to fetch the next page
 
-    class Config:
-        from_attributes = True
+
+class CaseDetailResponse(CaseResponse):
+    messages: List["MessageResponse"]
 
 
 class MessageResponse(BaseModel):
     id: int
     role: str
     content: str
-    created_at: str
+    created_at: datetime
 
     class Config:
         from_attributes = True
 
 
-@router.get("", response_model=List[CaseResponse])
+# Validate and serialize whole responses in one pass
+_CASE_PAGE_ADAPTER = TypeAdapter(CasePage)
+_MESSAGE_LIST_ADAPTER = TypeAdapter(List[MessageResponse])
+
+
+def _encode_cursor(row) -> str:
+    """Opaque cursor holding the (updated_at, id) of a page's last case."""
+    return base64.urlsafe_b64encode(orjson.dumps([row.updated_at.isoformat(), row.id])).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        updated_at, case_id = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(updated_at), int(case_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def _json_response(adapter: TypeAdapter, data) -> Response:
+    validated = adapter.validate_python(data, from_attributes=True)
+    return Response(content=adapter.dump_json(validated), media_type="application/json")
+
+
+@router.get("", response_model=CasePage)
 async def list_cases(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=200),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
-    List all cases for the current user.
+    List the current user's cases, most recently updated first, one page at a time.
     """
-    result = await db.execute(
-        select(Case)
-        .where(Case.user_id == current_user.id)
-        .order_by(Case.updated_at.desc())
-    )
-    cases = result.scalars().all()
+    params = {"uid": current_user.id, "limit": limit + 1}
+    if cursor is None:
+        result = await db.execute(_cases_first_page, params)
+    else:
+        after_updated, after_id = _decode_cursor(cursor)
+        result = await db.execute(_cases_next_page, dict(params, after_updated=after_updated, after_id=after_id))
+    rows = result.all()
     
-    return [
-        CaseResponse(
-            id=case.id,
-            title=case.title,
-            created_at=case.created_at.isoformat(),
-            updated_at=case.updated_at.isoformat()
-        )
-        for case in cases
-    ]
+    # One extra row was fetched to tell whether another page follows
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1])
+    
+    return _json_response(_CASE_PAGE_ADAPTER, {"items": rows, "next_cursor": next_cursor})
 
 
 @router.post("", response_model=CaseResponse, status_code=status.HTTP_201_CREATED)
@@ -88,21 +162,13 @@ async def create_case(
     """
     Create a new investigation case.
     """
-    new_case = Case(
-        user_id=current_user.id,
-        title=case_data.title,
-        graph_json=json.dumps({"directed": False, "multigraph": False, "graph": {}, "nodes": [], "links": []})
-    )
+    # No graph_json: the graph lives in the entities/relations tables and starts empty
+    new_case = Case(user_id=current_user.id, title=case_data.title)
     db.add(new_case)
     await db.commit()
     await db.refresh(new_case)
     
-    return CaseResponse(
-        id=new_case.id,
-        title=new_case.title,
-        created_at=new_case.created_at.isoformat(),
-        updated_at=new_case.updated_at.isoformat()
-    )
+    return new_case
 
 
 @router.get("/{case_id}", response_model=CaseDetailResponse)
@@ -114,12 +180,18 @@ async def get_case(
     """
     Get case details including messages.
     """
+    # One query: the case and its messages joined, loading only the response's columns
     result = await db.execute(
         select(Case)
-        .options(selectinload(Case.messages))
+        .options(
+            load_only(Case.id, Case.title, Case.created_at, Case.updated_at),
+            joinedload(Case.messages).load_only(
+                Message.id, Message.role, Message.content, Message.created_at
+            ),
+        )
         .where(Case.id == case_id, Case.user_id == current_user.id)
     )
-    case = result.scalar_one_or_none()
+    case = result.unique().scalar_one_or_none()
     
     if not case:
         raise HTTPException(
@@ -127,21 +199,7 @@ async def get_case(
             detail="Case not found"
         )
     
-    return CaseDetailResponse(
-        id=case.id,
-        title=case.title,
-        created_at=case.created_at.isoformat(),
-        updated_at=case.updated_at.isoformat(),
-        messages=[
-            MessageResponse(
-                id=msg.id,
-                role=msg.role,
-                content=msg.content,
-                created_at=msg.created_at.isoformat()
-            )
-            for msg in case.messages
-        ]
-    )
+    return case
 
 
 @router.delete("/{case_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -153,9 +211,7 @@ async def delete_case(
     """
     Delete a case and all its messages.
     """
-    result = await db.execute(
-        select(Case).where(Case.id == case_id, Case.user_id == current_user.id)
-    )
+    result = await db.execute(_case_for_user, {"cid": case_id, "uid": current_user.id})
     case = result.scalar_one_or_none()
     
     if not case:
@@ -166,6 +222,7 @@ async def delete_case(
     
     await db.delete(case)
     await db.commit()
+    invalidate_case_graph(case_id)
 
 
 @router.get("/{case_id}/messages", response_model=List[MessageResponse])
@@ -178,9 +235,7 @@ async def get_case_messages(
     Get all messages for a specific case.
     """
     # Verify case belongs to user
-    result = await db.execute(
-        select(Case).where(Case.id == case_id, Case.user_id == current_user.id)
-    )
+    result = await db.execute(_case_for_user, {"cid": case_id, "uid": current_user.id})
     case = result.scalar_one_or_none()
     
     if not case:
@@ -190,19 +245,5 @@ async def get_case_messages(
         )
     
     # Get messages
-    result = await db.execute(
-        select(Message)
-        .where(Message.case_id == case_id)
-        .order_by(Message.created_at)
-    )
-    messages = result.scalars().all()
-    
-    return [
-        MessageResponse(
-            id=msg.id,
-            role=msg.role,
-            content=msg.content,
-            created_at=msg.created_at.isoformat()
-        )
-        for msg in messages
-    ]
+    result = await db.execute(_messages_for_case, {"cid": case_id})
+    return _json_response(_MESSAGE_LIST_ADAPTER, result.scalars().all())
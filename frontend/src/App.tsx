@@ -43,6 +43,8 @@ function AppContent() {
   const [cases, setCases] = useState<Case[]>([]);
   const [selectedCaseId, setSelectedCaseId] = useState<number | null>(null);
   const [isCasesLoading, setIsCasesLoading] = useState(true);
+  const [casesCursor, setCasesCursor] = useState<string | null>(null);
+  const [isMoreCasesLoading, setIsMoreCasesLoading] = useState(false);
 
   // Load cases on mount
   useEffect(() => {
@@ -70,11 +72,13 @@ function AppContent() {
   const loadCases = async () => {
     setIsCasesLoading(true);
     try {
-      const userCases = await api.getCases();
-      setCases(userCases);
+      // Only the first page; later pages are fetched on demand
+      const page = await api.getCases();
+      setCases(page.items);
+      setCasesCursor(page.next_cursor);
       // Select first case if available
-      if (userCases.length > 0 && !selectedCaseId) {
-        setSelectedCaseId(userCases[0].id);
+      if (page.items.length > 0 && !selectedCaseId) {
+        setSelectedCaseId(page.items[0].id);
       }
     } catch (error) {
       console.error('Failed to load cases:', error);
@@ -83,6 +87,20 @@ function AppContent() {
     }
   };
 
+  const loadMoreCases = async () => {
+    if (casesCursor === null || isMoreCasesLoading) return;
+    setIsMoreCasesLoading(true);
+    try {
+      const page = await api.getCases(casesCursor);
+      setCases((prev) => [...prev, ...page.items]);
+      setCasesCursor(page.next_cursor);
+    } catch (error) {
+      console.error('Failed to load more cases:', error);
+    } finally {
+      setIsMoreCasesLoading(false);
+    }
+  };
+
   const loadCaseData = async (caseId: number) => {
     try {
       const caseDetail = await api.getCase(caseId);
@@ -208,6 +226,9 @@ function AppContent() {
         onCreateCase={handleCreateCase}
         onDeleteCase={handleDeleteCase}
         isCasesLoading={isCasesLoading}
+        hasMoreCases={casesCursor !== null}
+        onLoadMoreCases={loadMoreCases}
+        isMoreCasesLoading={isMoreCasesLoading}
       />
 
       {/* Main Content */}
@@ -16,6 +16,9 @@ interface SidebarProps {
   onCreateCase: (title: string) => void;
   onDeleteCase: (caseId: number) => void;
   isCasesLoading: boolean;
+  hasMoreCases: boolean;
+  onLoadMoreCases: () => void;
+  isMoreCasesLoading: boolean;
 }
 
 export const Sidebar: React.FC<SidebarProps> = ({
@@ -28,6 +31,9 @@ export const Sidebar: React.FC<SidebarProps> = ({
   onCreateCase,
   onDeleteCase,
   isCasesLoading,
+  hasMoreCases,
+  onLoadMoreCases,
+  isMoreCasesLoading,
 }) => {
   const [showConfirm, setShowConfirm] = useState(false);
   const [showNewCase, setShowNewCase] = useState(false);
@@ -230,6 +236,17 @@ export const Sidebar: React.FC<SidebarProps> = ({
               </div>
             ))
           )}
+          {!isCasesLoading && hasMoreCases && (
+            <Button
+              variant="ghost"
+              size="sm"
+              onClick={onLoadMoreCases}
+              disabled={isMoreCasesLoading}
+              className="w-full text-xs text-muted-foreground"
+            >
+              {isMoreCasesLoading ? <Loader2 className="w-4 h-4 animate-spin" /> : 'Load more'}
+            </Button>
+          )}
         </div>
       </div>
 
@@ -49,6 +49,11 @@ export interface Case {
   updated_at: string;
 }
 
+export interface CasePage {
+  items: Case[];
+  next_cursor: string | null;
+}
+
 export interface CaseDetail extends Case {
   messages: Array<{
     id: number;
@@ -112,8 +117,9 @@ async function getCurrentUser(token?: string): Promise<User> {
 }
 
 // Case API functions
-async function getCases(): Promise<Case[]> {
-  const response = await fetch(`${API_BASE_URL}/api/cases`, {
+async function getCases(cursor: string | null = null): Promise<CasePage> {
+  const query = cursor === null ? '' : `?cursor=${encodeURIComponent(cursor)}`;
+  const response = await fetch(`${API_BASE_URL}/api/cases${query}`, {
     headers: getAuthHeaders(),
   });
 